@@ -1,14 +1,24 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from ...services.hints_generator import hints_generation_service
-from hints_service.schemas import *
+from hints_service.schemas import TextBasedHintRequest
 
 router = APIRouter(prefix="/entities", tags=["Entities extraction"])
 
+_generate = hints_generation_service.generate_time_hint
+_generate_stream = hints_generation_service.generate_time_hint_stream
+
 
 @router.post("/get_text_based_hint")
-async def get_from_text(request: TextBasedHintRequest):
+async def get_from_text(request: TextBasedHintRequest, stream: bool = False):
     try:
-        hint = await hints_generation_service.generate_time_hint(request)
+        if stream:
+            events = await _generate_stream(request)
+            if not events:
+                raise HTTPException(status_code=404, detail="No hints generated")
+            return StreamingResponse(events, media_type="text/event-stream")
+
+        hint = await _generate(request)
         if not hint:
             raise HTTPException(status_code=404, detail="No hints generated")
         return hint
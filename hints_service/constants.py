@@ -5,3 +5,5 @@ load_dotenv()
 
 IAM = os.getenv("IAM")
 FOLDER_ID = os.getenv("FOLDER_ID")
+REDIS_URL = os.getenv("REDIS_URL")
+USE_SIMSIMD = os.getenv("USE_SIMSIMD", "0") == "1"
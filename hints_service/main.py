@@ -1,5 +1,17 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from .api.endpoints import hints
+from .services.hints_generator import hints_generation_service
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    hints_generation_service.start()
+    yield
+    await hints_generation_service.aclose()
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 app.include_router(hints.router)
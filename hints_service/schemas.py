@@ -1,7 +1,38 @@
-from enum import Enum
-from pydantic import BaseModel, validator
+import re
 from datetime import datetime
-from typing import List, Optional
+from enum import Enum
+from pydantic import BaseModel, PlainSerializer, ValidationError, WithJsonSchema, WrapValidator
+from typing import Annotated, Optional
+
+_DT_PATTERN = r"^[0-9]{4}-[0-9]{2}-[0-9]{2} [0-9]{2}:[0-9]{2}$"
+_DT_RE = re.compile(_DT_PATTERN)
+_DT_ERROR = "Некорректный формат времени. Используйте 'YYYY-MM-DD HH:MM'"
+
+
+def _validate_datetime(v, handler):
+    """Пропускает только 'YYYY-MM-DD HH:MM', сам разбор и проверку диапазонов делает pydantic-core"""
+    if isinstance(v, datetime):
+        return v
+    if not isinstance(v, str) or not _DT_RE.match(v):
+        raise ValueError(_DT_ERROR)
+    try:
+        return handler(v)
+    except ValidationError:
+        raise ValueError(_DT_ERROR)
+
+
+def format_datetime(dt: datetime) -> str:
+    """Форматирует время в 'YYYY-MM-DD HH:MM' без strftime (формат фиксированный)"""
+    return f"{dt.year:04d}-{dt.month:02d}-{dt.day:02d} {dt.hour:02d}:{dt.minute:02d}"
+
+
+# Время хранится как datetime, а в JSON по-прежнему передается строкой 'YYYY-MM-DD HH:MM'
+DateTime = Annotated[
+    datetime,
+    WrapValidator(_validate_datetime),
+    PlainSerializer(format_datetime, return_type=str),
+    WithJsonSchema({"type": "string", "pattern": _DT_PATTERN})
+]
 
 
 class CategoryType(str, Enum):
@@ -29,41 +60,15 @@ class TriggerDto(BaseModel):
 
 class NoteDto(BaseModel):
     text: str
-    createdAt: str
-    updatedAt: Optional[str] = None  # Поле может быть null
+    createdAt: DateTime
+    updatedAt: Optional[DateTime] = None  # Поле может быть null
     categoryType: CategoryType
-    triggers: List[TriggerDto]
-
-    @validator("createdAt")
-    def validate_created_at(cls, v):
-        try:
-            datetime.strptime(v, "%Y-%m-%d %H:%M")
-            return v
-        except ValueError:
-            raise ValueError("Некорректный формат времени. Используйте 'YYYY-MM-DD HH:MM'")
-
-    @validator("updatedAt")
-    def validate_updated_at(cls, v):
-        if v is None:
-            return v
-        try:
-            datetime.strptime(v, "%Y-%m-%d %H:%M")
-            return v
-        except ValueError:
-            raise ValueError("Некорректный формат времени. Используйте 'YYYY-MM-DD HH:MM'")
+    triggers: list[TriggerDto]
 
 
 class TextBasedHintRequest(BaseModel):
-    context: List[NoteDto]
-    current_time: str
-
-    @validator("current_time")
-    def validate_time(cls, v):
-        try:
-            datetime.strptime(v, "%Y-%m-%d %H:%M")
-            return v
-        except ValueError:
-            raise ValueError("Некорректный формат времени. Используйте 'YYYY-MM-DD HH:MM'")
+    context: list[NoteDto]
+    current_time: DateTime
 
 
 class TextBasedHintResponse(BaseModel):
@@ -1,15 +1,116 @@
+import asyncio
+import hashlib
+import re
+from array import array
 from collections import defaultdict
-from datetime import time
-from typing import Dict
+from datetime import datetime, time, timedelta
+from functools import lru_cache
+from typing import AsyncIterator, Dict, Final, List, Optional, Set, Tuple
 
 import httpx
 import numpy as np
+import orjson
+import redis.asyncio as redis
 from fastapi import HTTPException
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.feature_extraction.text import HashingVectorizer
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+from sklearn.preprocessing import normalize
+from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt, wait_exponential
+
+from hints_service.schemas import (
+    CategoryType, NoteDto, TextBasedHintRequest, TextBasedHintResponse, TriggerDto, TriggerType, format_datetime
+)
+from hints_service.constants import FOLDER_ID, IAM, REDIS_URL, USE_SIMSIMD
+from hints_service.services._kernels import aggregate, dense_similarity_graph, simsimd
+
+# Часы и минуты в конце строки вида "YYYY-MM-DD HH:MM"
+_HM_RE = re.compile(r"([01]\d|2[0-3]):([0-5]\d)$")
+
+# Номер слота категории в заранее выделенном списке корзин, по одному слоту на категорию в порядке CategoryType;
+# этот порядок и держит порядок групп стабильным
+_CAT_INDEX: Final = {category: i for i, category in enumerate(CategoryType)}
+_N_CATS: Final = len(CategoryType)
+
+_COMPLETION_OPTIONS: Final = {
+    "stream": False,
+    "temperature": 0.1,
+    "maxTokens": 1000
+}
+
+_STREAM_COMPLETION_OPTIONS: Final = {**_COMPLETION_OPTIONS, "stream": True}
+
+_BATCH_INSTRUCTION: Final = """
+        Ввод содержит JSON-массив из {count} напоминаний. Верни JSON-массив из {count} строк — \
+        по одной подсказке для каждого напоминания в том же порядке, без пояснений.
+        """
+
+_PROMPT_TEMPLATE: Final = """
+        Ты — AI-ассистент для создания "умных" подсказок. Ты получаешь напоминание в JSON формате, \
+        которое нужно предложить пользователю, учитывая его текущее время: {current_time}.
+        Возвращай подсказку одним односложным предложением.
 
-from hints_service.schemas import *
-from hints_service.constants import *
+        ### Допустимые значения:
+        - `categoryType`: Time, Location, Event, Shopping, Call, Meeting, Deadline, Health, Routine, Other  
+        - `triggerType`: Time, Location
+
+        ### Правила:
+        1. `categoryType` определяется по смыслу напоминания:
+           - "купить молоко" → Shopping  
+           - "позвонить маме" → Call  
+           - "встреча в кафе" → Meeting  
+        2. `triggerType` зависит от условия:
+           - "в 18:00" → Time 
+           - "через 2 часа" → Time
+           - "когда буду в Пятёрочке" → Location  
+        3. Для относительного времени (e.g., "завтра", "через час") \
+        всегда указывай абсолютное время в формате "YYYY-MM-DD HH:MM".
+
+        ### Пример 1 (с текущим временем {current_time} = "2025-06-16 15:00"):
+        Ввод: 
+        {{
+            "text": "Выгулять собаку",
+            "categoryType": "Routine",
+            "triggers": [
+                {{
+                    "triggerType": "Time",
+                    "triggerValue": "2025-06-16 18:00"
+                }}
+            ]
+        }}
+        Вывод:
+        Напомнить выгулять собаку через 3 часа?
+
+        ### Пример 2 (с текущим временем {current_time} = "2025-06-16 09:00"):
+        Ввод:
+        {{
+            "text": "Позвонить врачу",
+            "categoryType": "Health",
+            "triggers": [
+                {{
+                    "triggerType": "Time",
+                    "triggerValue": "2025-06-17 10:00"
+                }}
+            ]
+        }}
+        Вывод:
+        Напомнить позвонить врачу завтра в 10:00
+
+        Теперь предложи пользователю подсказку для следующего напоминания в формате JSON \
+        (текущее время: {current_time}):
+        """
+
+# Постоянные куски промпта между подстановками текущего времени, собираются один раз при импорте
+_PROMPT_PARTS: Final = tuple(
+    part.replace("{{", "{").replace("}}", "}") for part in _PROMPT_TEMPLATE.split("{current_time}")
+)
+
+
+def _is_retryable(e: BaseException) -> bool:
+    """Повторяем запрос при сетевых ошибках, 429 и 5xx от YandexGPT"""
+    if isinstance(e, httpx.HTTPStatusError):
+        return e.response.status_code == 429 or e.response.status_code >= 500
+    return isinstance(e, httpx.TransportError)
 
 
 class HintsGenerationService:
@@ -17,133 +118,339 @@ class HintsGenerationService:
         if not IAM or not FOLDER_ID:
             print("Warning: IAM or FOLDER_ID not set")
         self.ygpt_url = "https://llm.api.cloud.yandex.net/foundationModels/v1/completion"
+        self.ygpt_model_uri = f"gpt://{FOLDER_ID}/yandexgpt-lite"
         self.ygpt_headers = {
             "Authorization": f"Bearer {IAM}",
-            "x-folder-id": FOLDER_ID,
+            "x-folder-id": FOLDER_ID or "",
             "Content-Type": "application/json"
         }
-        self.time_format = "%Y-%m-%d %H:%M"
-        self.vectorizer = TfidfVectorizer(
+        # Один клиент на сервис: HTTP/2 мультиплексирует запросы к YandexGPT поверх немногих соединений
+        self._client = httpx.AsyncClient(
+            http2=True,
+            timeout=30.0,
+            headers=self.ygpt_headers,
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=32)
+        )
+        self._gpt_sem = asyncio.Semaphore(50)  # Ограничение одновременных запросов к YandexGPT
+        self.batch_window = 0.02  # Окно сбора заметок в один запрос к YandexGPT, сек
+        self.max_batch_size = 16
+        self._batch_queue: asyncio.Queue = asyncio.Queue()
+        self._batch_task: Optional[asyncio.Task] = None
+        self._batch_jobs: Set[asyncio.Task] = set()
+        # Короткие таймауты: недоступный или зависший Redis не должен задерживать ответ,
+        # ошибка кэша сразу уходит в генерацию подсказки без него
+        self._cache = redis.from_url(
+            REDIS_URL,
+            socket_connect_timeout=0.1,
+            socket_timeout=0.1
+        ) if REDIS_URL else None
+        self.cache_ttl = 300  # Время жизни закэшированной подсказки, сек
+        # Векторизатор без состояния: словарь не нужно обучать, новые слова не теряются.
+        # Он дает только частоты слов, IDF и отсев по min_df/max_df считаются по заметкам запроса
+        self.vectorizer = HashingVectorizer(
             analyzer='word',
             token_pattern=r'\w+',
-            min_df=0.1,
-            max_df=0.9
+            n_features=2 ** 18,
+            alternate_sign=False,
+            norm=None,
+            dtype=np.float32  # Для косинуса коротких текстов float32 хватает, а данных вдвое меньше
         )
-        self.similarity_threshold = 0.7  # Порог для группировки заметок
-        self._fit_vectorizer = False
+        self.min_df = 0.1
+        self.max_df = 0.9
+        self.similarity_threshold = np.float32(0.7)  # Порог для группировки заметок, в типе матрицы сходства
+        self.dense_grouping_limit = 8  # Меньше заметок в категории - группируем на плотной матрице
+        self.simsimd_min_notes = 256  # С какого числа заметок в категории сходство считает simsimd
+        self.use_simsimd = USE_SIMSIMD and simsimd is not None
+        if USE_SIMSIMD and simsimd is None:
+            print("Warning: USE_SIMSIMD is set but simsimd is not installed")
+
+    def start(self):
+        """Запускает фоновую отправку заметок в YandexGPT пачками"""
+        if self._batch_task is None:
+            self._batch_task = asyncio.create_task(self._run_batches())
+
+    async def aclose(self):
+        """Закрывает HTTP-клиент YandexGPT и соединение с кэшем"""
+        if self._batch_task is not None:
+            self._batch_task.cancel()
+            self._batch_task = None
+        await self._client.aclose()
+        if self._cache is not None:
+            await self._cache.aclose()
 
     async def generate_time_hint(self, request: TextBasedHintRequest) -> Optional[TextBasedHintResponse]:
         """Генерация подсказки на основе временных паттернов"""
         time_notes = request.context
 
-        if not time_notes:
+        if not time_notes or not self._has_time_triggers(time_notes):
             return None
 
-        grouped_notes = self._group_similar_notes(time_notes)
-        best_group = self._find_best_recommendation(grouped_notes, request.current_time)
+        # Ключ кэша - сериализация и хеш всего запроса, без Redis его не считаем
+        cache_key = None
+        if self._cache is not None:
+            cache_key = hashlib.blake2b(request.model_dump_json().encode(), digest_size=16).hexdigest()
+            cached = await self._get_cached_hint(cache_key)
+            if cached:
+                return cached
 
-        if not best_group:
+        hint_note = self._suggest_note(time_notes, request.current_time)
+
+        if not hint_note:
             return None
 
-        return await self._build_hint_from_group(best_group, request.current_time)
+        hint = TextBasedHintResponse(
+            note=hint_note,
+            hintText=await self.generate_hint_by_note(hint_note, request.current_time)
+        )
+        if cache_key is not None:
+            await self._set_cached_hint(cache_key, hint)
 
-    def _group_similar_notes(self, notes: List[NoteDto]) -> Dict[CategoryType, List]:
-        """Группировка заметок с использованием TF-IDF"""
-        grouped = defaultdict(list)
+        return hint
 
-        # Собираем все тексты для "обучения" TF-IDF
-        if not self._fit_vectorizer:
-            all_texts = [n.text for n in notes]
-            self.vectorizer.fit(all_texts)
-            self._fit_vectorizer = True
+    async def generate_time_hint_stream(self, request: TextBasedHintRequest) -> Optional[AsyncIterator[str]]:
+        """Генерация подсказки с потоковой выдачей текста YandexGPT в виде server-sent events"""
+        time_notes = request.context
 
-        for category in CategoryType:
-            category_notes = [n for n in notes if n.categoryType == category]
+        if not time_notes or not self._has_time_triggers(time_notes):
+            return None
 
-            # Скипаем категории в которых мало заметок
-            if len(category_notes) < 2:
-                continue
+        hint_note = self._suggest_note(time_notes, request.current_time)
 
-            # Преобразуем тексты в TF-IDF матрицу
-            texts = [n.text for n in category_notes]
-            tfidf_matrix = self.vectorizer.transform(texts)
+        if not hint_note:
+            return None
 
-            # Считаем косинусное сходство (матрицу)
-            sim_matrix = cosine_similarity(tfidf_matrix)
+        chunks = self._complete_stream(
+            self.build_prompt(request.current_time),
+            "Ввод: \n" + hint_note.model_dump_json()
+        )
 
-            # Группируем похожие заметки
-            groups = []
-            used_indices = set()
+        # Открываем стрим до ответа клиенту, чтобы ошибка YandexGPT еще могла стать статусом ответа
+        first = await anext(chunks, None)
 
-            for i in range(len(category_notes)):
-                if i not in used_indices:
-                    similar_indices = np.where(sim_matrix[i] > self.similarity_threshold)[0]
-                    group = [category_notes[j] for j in similar_indices]
-                    groups.append(group)
-                    used_indices.update(similar_indices)
+        return self._hint_events(hint_note, first, chunks)
 
-            grouped[category] = groups
+    @staticmethod
+    async def _hint_events(note: NoteDto, first: Optional[str], chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+        """Сначала отдает заметку, затем текст подсказки по мере генерации"""
+        try:
+            yield f"event: note\ndata: {note.model_dump_json()}\n\n"
+            if first is None:
+                return
+            yield f"event: hint\ndata: {orjson.dumps({'hintText': first}).decode()}\n\n"
+            async for text in chunks:
+                yield f"event: hint\ndata: {orjson.dumps({'hintText': text}).decode()}\n\n"
+        finally:
+            # Закрываем запрос к YandexGPT и при обрыве соединения клиентом
+            await chunks.aclose()
 
-        return grouped
+    @staticmethod
+    def _has_time_triggers(notes: List[NoteDto]) -> bool:
+        """Есть ли в контексте хоть один триггер по времени, без них подсказку не построить"""
+        return any(trigger.triggerType == TriggerType.TIME for note in notes for trigger in note.triggers)
 
-    def _find_best_recommendation(self, grouped_notes: Dict[CategoryType, List], current_time: str) -> Optional[List]:
-        """Выбирает лучшую группу для рекомендации"""
-        current_dt = datetime.strptime(current_time, self.time_format)
-        best_group = None
-        best_score = 0
+    async def _get_cached_hint(self, key: str) -> Optional[TextBasedHintResponse]:
+        """Достает подсказку из кэша; ошибки кэша не должны ломать генерацию"""
+        if self._cache is None:
+            return None
+        try:
+            cached = await self._cache.get(f"hint:{key}")
+            return TextBasedHintResponse.model_validate_json(cached) if cached else None
+        except Exception as e:
+            print(f"Warning: hints cache is unavailable: {e}")
+            return None
 
-        for category, groups in grouped_notes.items():
-            for group in groups:
-                if len(group) < 2:
-                    continue
+    async def _set_cached_hint(self, key: str, hint: TextBasedHintResponse):
+        """Кладет подсказку в кэш на короткое время"""
+        if self._cache is None:
+            return
+        try:
+            await self._cache.setex(f"hint:{key}", self.cache_ttl, hint.model_dump_json())
+        except Exception as e:
+            print(f"Warning: hints cache is unavailable: {e}")
 
-                time_pattern = self._analyze_group_time_pattern(group)
-                score = self._calculate_group_score(time_pattern, current_dt)
+    def _suggest_note(self, notes: List[NoteDto], current_dt: datetime) -> Optional[NoteDto]:
+        """Находит лучшую группу похожих заметок и строит по ней предлагаемую заметку"""
+        groups = self._group_similar_notes(notes)
+        if not groups:
+            return None
 
-                if score > best_score:
-                    best_score = score
-                    best_group = group
+        # Время создания и триггеров разбираем один раз на весь запрос
+        note_times = self._note_times(notes)
+        best = self._find_best_recommendation(groups, note_times, current_dt)
 
-        return best_group
+        if best is None:
+            return None
 
-    def _analyze_group_time_pattern(self, group: List[NoteDto]) -> Dict:
-        """Анализирует временные паттерны группы заметок"""
-        trigger_times = []
-        creation_times = []
+        best_group, time_pattern = best
+        return self._build_hint_note(notes, best_group, time_pattern, current_dt)
 
-        for note in group:
-            for trigger in note.triggers:
-                if trigger.triggerType == TriggerType.TIME:
-                    trigger_times.append(datetime.strptime(trigger.triggerValue, self.time_format))
+    def _group_similar_notes(self, notes: List[NoteDto]) -> List[np.ndarray]:
+        """Группировка заметок с использованием TF-IDF, группа - номера заметок в контексте"""
+        groups = []
+
+        # TF-IDF матрица по всем заметкам запроса, категории берут из нее свои строки
+        tfidf_all = self._tfidf_matrix(notes)
+
+        # Раскладываем номера заметок по категориям за один проход
+        buckets = [[] for _ in range(_N_CATS)]
+        for i, n in enumerate(notes):
+            buckets[_CAT_INDEX[n.categoryType]].append(i)
+
+        for indices in buckets:
+            # Скипаем категории в которых мало заметок
+            if len(indices) < 2:
+                continue
+
+            tfidf_matrix = tfidf_all[indices]
+
+            # Группы похожих заметок - компоненты связности графа сходства
+            if len(indices) < self.dense_grouping_limit:
+                # Строки нормированы, поэтому X @ X.T - косинусное сходство
+                sim_matrix = (tfidf_matrix @ tfidf_matrix.T).toarray()
+                labels = self._dense_components(sim_matrix > self.similarity_threshold)
+            elif self.use_simsimd and len(indices) >= self.simsimd_min_notes:
+                graph = dense_similarity_graph(tfidf_matrix, self.similarity_threshold)
+                _, labels = connected_components(graph, directed=False)
+            else:
+                # Для средних категорий матрица сходства остается разреженной
+                sim_matrix = (tfidf_matrix @ tfidf_matrix.T).tocsr()
+                sim_matrix.data[sim_matrix.data <= self.similarity_threshold] = 0
+                sim_matrix.eliminate_zeros()
+                _, labels = connected_components(sim_matrix, directed=False)
+
+            # Стабильная сортировка сохраняет порядок заметок внутри группы
+            order = np.argsort(labels, kind='stable')
+            starts = np.flatnonzero(np.diff(labels[order])) + 1
+            groups.extend(group for group in np.split(np.asarray(indices)[order], starts) if len(group) >= 2)
+
+        return groups
+
+    @staticmethod
+    def _dense_components(adjacency: np.ndarray) -> np.ndarray:
+        """Компоненты связности маленького графа: метка компоненты - наименьший номер вершины в ней"""
+        labels = np.arange(len(adjacency))
+        for i, j in np.argwhere(np.triu(adjacency, 1)):
+            a, b = labels[i], labels[j]
+            if a != b:
+                labels[labels == max(a, b)] = min(a, b)
+
+        return labels
+
+    def _tfidf_matrix(self, notes: List[NoteDto]) -> sparse.csr_matrix:
+        """TF-IDF по заметкам запроса: как TfidfVectorizer.fit_transform, но поверх хешированных частот"""
+        counts = sparse.vstack([self._vectorize_text(n.text) for n in notes], format='csr')
+        n_docs = counts.shape[0]
+
+        # Документная частота каждого встреченного слова (в строке CSR индексы столбцов не повторяются)
+        _, columns, df = np.unique(counts.indices, return_inverse=True, return_counts=True)
+        idf = (np.log((1 + n_docs) / (1 + df)) + 1).astype(np.float32)
+        idf[(df < self.min_df * n_docs) | (df > self.max_df * n_docs)] = 0
+
+        counts.data *= idf[columns]
+        counts.eliminate_zeros()
+
+        # После нормировки строк X @ X.T сразу дает косинусное сходство
+        return normalize(counts, norm='l2', copy=False)
+
+    @lru_cache(maxsize=4096)
+    def _vectorize_text(self, text: str) -> sparse.csr_matrix:
+        """Частоты слов одной заметки; тексты напоминаний часто повторяются между запросами"""
+        return self.vectorizer.transform([text])
+
+    def _find_best_recommendation(self, groups: List[np.ndarray], note_times: Dict, current_dt: datetime) -> Optional[Tuple[np.ndarray, Dict]]:
+        """Выбирает лучшую группу для рекомендации и возвращает ее вместе с временным паттерном"""
+        # Группе без корректных триггеров по времени нечего рекомендовать, ее оценка всегда 0,
+        # поэтому такие группы отсекаем до подсчета статистик, а без кандидатов выходим сразу
+        has_trigger = np.zeros(len(note_times['creation']), dtype=bool)
+        has_trigger[note_times['trigger_notes']] = True
+        candidates = [group for group in groups if has_trigger[group].any()]
+        if not candidates:
+            return None
+
+        # У каждой заметки ровно одно время создания, так что число значений - это размер группы
+        avg_trigger, _, avg_creation, counts = self._groups_time_stats(candidates, note_times)
+        scores = self._calculate_groups_scores(avg_creation, counts, current_dt)
+
+        # argmax берет первую из равных групп, как и прежний проход с "score > best_score"
+        best = int(np.argmax(scores))
+        if scores[best] <= 0:
+            return None
+
+        # Статистики победителя уже посчитаны, повторно группу не разбираем
+        time_pattern = {
+            'avg_trigger': self._minutes_to_time(avg_trigger[best]),
+            'avg_creation': self._minutes_to_time(avg_creation[best]),
+            'count': int(counts[best])
+        }
+        return candidates[best], time_pattern
 
-            creation_times.append(datetime.strptime(note.createdAt, self.time_format))
+    @staticmethod
+    def _note_times(notes: List[NoteDto]) -> Dict:
+        """Минуты от начала суток для времени создания и триггеров по времени каждой заметки"""
+        # Время создания уже разобрано схемой, у каждой заметки ровно одно значение
+        creation = np.fromiter(
+            (note.createdAt.hour * 60 + note.createdAt.minute for note in notes),
+            dtype=np.int16,
+            count=len(notes)
+        )
 
-        avg_trigger = self._average_time([t.time() for t in trigger_times])
-        avg_creation = self._average_time([t.time() for t in creation_times])
+        # Для триггеров запоминаем номер заметки, к которой они относятся
+        trigger_notes, trigger_times = array('i'), array('h')
+        for i, note in enumerate(notes):
+            for trigger in note.triggers:
+                if trigger.triggerType != TriggerType.TIME:
+                    continue
+                m = _HM_RE.search(trigger.triggerValue)
+                if not m:
+                    continue
+                trigger_notes.append(i)
+                trigger_times.append(int(m[1]) * 60 + int(m[2]))
 
         return {
-            'avg_trigger': avg_trigger,
-            'avg_creation': avg_creation,
-            'count': len(group)
+            'creation': creation,
+            'trigger_notes': np.frombuffer(trigger_notes, dtype=np.int32),
+            'triggers': np.frombuffer(trigger_times, dtype=np.int16)
         }
 
-    def _calculate_group_score(self, time_pattern: Dict, current_dt: datetime) -> float:
-        """Вычисляет релевантность группы для текущего времени"""
-        current_time = current_dt.time()
-        avg_creation = time_pattern['avg_creation']
+    @staticmethod
+    def _groups_time_stats(groups: List[np.ndarray], note_times: Dict) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Средние минуты и число значений для триггеров и времени создания по каждой группе"""
+        # Заметки групп подряд: время создания суммируется по отрезкам, а размер группы - число значений
+        members = np.concatenate(groups)
+        creation_counts = np.fromiter(map(len, groups), dtype=np.int64, count=len(groups))
+        starts = np.cumsum(creation_counts) - creation_counts
+        creation_sums = np.add.reduceat(note_times['creation'][members].astype(np.int64), starts)
+
+        # Номер группы для каждой заметки (-1 - заметка не в группе), группы не пересекаются
+        note_groups = np.full(len(note_times['creation']), -1, dtype=np.int32)
+        note_groups[members] = np.repeat(np.arange(len(groups), dtype=np.int32), creation_counts)
+
+        trigger_groups = note_groups[note_times['trigger_notes']]
+        in_group = trigger_groups >= 0
+        trigger_sums, trigger_counts = aggregate(
+            trigger_groups[in_group], note_times['triggers'][in_group], len(groups)
+        )
+
+        avg_trigger = trigger_sums // np.maximum(trigger_counts, 1)
+        avg_creation = creation_sums // creation_counts
 
-        time_diff = (current_dt - datetime.combine(current_dt.date(), avg_creation)).total_seconds() / 3600
-        time_factor = max(0, 1 - abs(time_diff) / 12)
-        count_factor = min(1, time_pattern['count'] / 5)
+        return avg_trigger, trigger_counts, avg_creation, creation_counts
+
+    @staticmethod
+    def _calculate_groups_scores(avg_creation: np.ndarray, counts: np.ndarray, current_dt: datetime) -> np.ndarray:
+        """Вычисляет релевантность групп для текущего времени"""
+        current_minutes = current_dt.hour * 60 + current_dt.minute
+
+        time_diff = (current_minutes - avg_creation) / 60
+        time_factor = np.maximum(0, 1 - np.abs(time_diff) / 12)
+        count_factor = np.minimum(1, counts / 5)
 
         return time_factor * count_factor
 
-    async def _build_hint_from_group(self, group: List[NoteDto], current_time: str) -> TextBasedHintResponse:
-        """Создает подсказку на основе группы заметок"""
-        time_pattern = self._analyze_group_time_pattern(group)
-        category = group[0].categoryType
-        reminder_text = group[0].text
-        current_dt = datetime.strptime(current_time, self.time_format)
+    def _build_hint_note(self, notes: List[NoteDto], group: np.ndarray, time_pattern: Dict, current_dt: datetime) -> NoteDto:
+        """Создает предлагаемую заметку на основе группы заметок"""
+        category = notes[group[0]].categoryType
+        reminder_text = notes[group[0]].text
 
         # Вычисляем рекомендуемое время триггера
         trigger_time = current_dt.replace(
@@ -153,81 +460,148 @@ class HintsGenerationService:
 
         # Если триггерное время уже прошло, переносим на следующий день
         if trigger_time <= current_dt:
-            trigger_time = trigger_time.replace(day=trigger_time.day + 1)
+            trigger_time += timedelta(days=1)
 
-        hint_note = NoteDto(
+        return NoteDto(
             text=reminder_text,
-            createdAt=current_time,
+            createdAt=current_dt,
             updatedAt=None,
             categoryType=category,
             triggers=[TriggerDto(
                 triggerType=TriggerType.TIME,
-                triggerValue=trigger_time.strftime(self.time_format)
+                triggerValue=format_datetime(trigger_time)
             )]
         )
 
-        hint_text = await self.generate_hint_by_note(hint_note, current_time)
+    @staticmethod
+    def _minutes_to_time(minutes: int) -> time:
+        """Переводит минуты от начала суток во время"""
+        minutes = int(minutes)
+        return time(hour=minutes // 60, minute=minutes % 60)
 
-        return TextBasedHintResponse(
-            note=hint_note,
-            hintText=hint_text
+    async def generate_hint_by_note(self, note: NoteDto, current_time: datetime) -> str:
+        """Постобработка предложенной заметки с помощью API YandexGPT"""
+        if self._batch_task is None:
+            return await self._generate_hint(note, current_time)
+
+        future = asyncio.get_running_loop().create_future()
+        await self._batch_queue.put((note, current_time, future))
+        return await future
+
+    async def _run_batches(self):
+        """Собирает заметки, пришедшие в течение batch_window, и отправляет их пачками"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._batch_queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._batch_queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Системный промпт зависит от текущего времени, поэтому пачки делим по нему
+            by_time = defaultdict(list)
+            for note, current_time, future in batch:
+                by_time[current_time].append((note, future))
+
+            for current_time, items in by_time.items():
+                job = asyncio.create_task(self._process_batch(items, current_time))
+                self._batch_jobs.add(job)
+                job.add_done_callback(self._batch_jobs.discard)
+
+    async def _process_batch(self, items: List[Tuple[NoteDto, asyncio.Future]], current_time: datetime):
+        """Генерирует подсказки для пачки заметок и раздает результаты ожидающим запросам"""
+        notes = [note for note, _ in items]
+        try:
+            if len(notes) == 1:
+                hints = [await self._generate_hint(notes[0], current_time)]
+            else:
+                hints = await self._generate_hints_batch(notes, current_time)
+        except Exception as e:
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), hint in zip(items, hints):
+            if not future.done():
+                future.set_result(hint)
+
+    async def _generate_hint(self, note: NoteDto, current_time: datetime) -> str:
+        """Подсказка для одной заметки"""
+        return await self._complete(
+            self.build_prompt(current_time),
+            "Ввод: \n" + note.model_dump_json()
+        )
+
+    async def _generate_hints_batch(self, notes: List[NoteDto], current_time: datetime) -> List[str]:
+        """Подсказки для нескольких заметок одним запросом к YandexGPT"""
+        llm_output = await self._complete(
+            self.build_prompt(current_time) + _BATCH_INSTRUCTION.format(count=len(notes)),
+            "Ввод: \n[" + ",".join(note.model_dump_json() for note in notes) + "]"
         )
 
+        hints = self._parse_batch_output(llm_output, len(notes))
+        if hints is None:
+            # Модель не вернула массив нужной длины - спрашиваем по одной заметке
+            hints = await asyncio.gather(*(self._generate_hint(note, current_time) for note in notes))
+
+        return hints
+
     @staticmethod
-    def _average_time(times: List[time]) -> time:
-        """Вычисляет среднее время из списка"""
-        total_seconds = sum(t.hour * 3600 + t.minute * 60 for t in times)
-        avg_seconds = total_seconds // len(times)
-        return time(hour=avg_seconds // 3600, minute=(avg_seconds % 3600) // 60)
+    def _parse_batch_output(llm_output: str, count: int) -> Optional[List[str]]:
+        """Разбирает JSON-массив подсказок из ответа модели"""
+        text = llm_output.strip().removeprefix("```json").removeprefix("```").removesuffix("```")
+        try:
+            hints = orjson.loads(text)
+        except orjson.JSONDecodeError:
+            return None
 
-    async def generate_hint_by_note(self, note: NoteDto, current_time) -> str:
-        """Постобработка предложенной заметки с помощью API YandexGPT"""
+        if not isinstance(hints, list) or len(hints) != count or not all(isinstance(h, str) for h in hints):
+            return None
 
-        note_dict = {
-            "text": note.text,
-            "createdAt": note.createdAt,
-            "updatedAt": note.updatedAt,
-            "categoryType": note.categoryType,
-            "triggers": [{
-                "triggerType": t.triggerType,
-                "triggerValue": t.triggerValue
-            } for t in note.triggers]
-        }
+        return hints
 
-        request_data = {
-            "modelUri": f"gpt://{FOLDER_ID}/yandexgpt-lite",
-            "completionOptions": {
-                "stream": False,
-                "temperature": 0.1,
-                "maxTokens": 1000
-            },
+    def _request_data(self, system_text: str, user_text: str, stream: bool = False) -> Dict:
+        """Тело запроса к API YandexGPT"""
+        return {
+            "modelUri": self.ygpt_model_uri,
+            "completionOptions": _STREAM_COMPLETION_OPTIONS if stream else _COMPLETION_OPTIONS,
             "messages": [
                 {
                     "role": "system",
-                    "text": self.build_prompt(current_time)
+                    "text": system_text
                 },
                 {
                     "role": "user",
-                    "text": f"Ввод: \n{note_dict}"
+                    "text": user_text
                 }
             ]
         }
 
-        try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(
-                    self.ygpt_url,
-                    headers=self.ygpt_headers,
-                    json=request_data
-                )
-                response.raise_for_status()
-
-                result = response.json()
-                llm_output = result['result']['alternatives'][0]['message']['text']
-
-                print(llm_output)
+    async def _complete(self, system_text: str, user_text: str) -> str:
+        """Запрос к API YandexGPT"""
+        # Тело сериализуем один раз, повторные попытки отправляют те же байты
+        content = orjson.dumps(self._request_data(system_text, user_text))
 
-                return llm_output
+        try:
+            async for attempt in AsyncRetrying(
+                retry=retry_if_exception(_is_retryable),
+                stop=stop_after_attempt(3),
+                wait=wait_exponential(multiplier=0.5, max=4),
+                reraise=True
+            ):
+                with attempt:
+                    async with self._gpt_sem:
+                        response = await self._client.post(self.ygpt_url, content=content)
+                    response.raise_for_status()
+
+            result = orjson.loads(response.content)
+            return result['result']['alternatives'][0]['message']['text']
 
         except httpx.HTTPStatusError as e:
             raise HTTPException(
@@ -240,62 +614,37 @@ class HintsGenerationService:
                 detail=f"Text processing failed: {str(e)}"
             )
 
-    @staticmethod
-    def build_prompt(current_time: str) -> str:
-        return f"""
-        Ты — AI-ассистент для создания "умных" подсказок. Ты получаешь напоминание в JSON формате, \
-        которое нужно предложить пользователю, учитывая его текущее время: {current_time}.
-        Возвращай подсказку одним односложным предложением.
-
-        ### Допустимые значения:
-        - `categoryType`: Time, Location, Event, Shopping, Call, Meeting, Deadline, Health, Routine, Other  
-        - `triggerType`: Time, Location
+    async def _complete_stream(self, system_text: str, user_text: str) -> AsyncIterator[str]:
+        """Потоковый запрос к API YandexGPT, итератор по мере роста текста ответа"""
+        content = orjson.dumps(self._request_data(system_text, user_text, stream=True))
 
-        ### Правила:
-        1. `categoryType` определяется по смыслу напоминания:
-           - "купить молоко" → Shopping  
-           - "позвонить маме" → Call  
-           - "встреча в кафе" → Meeting  
-        2. `triggerType` зависит от условия:
-           - "в 18:00" → Time 
-           - "через 2 часа" → Time
-           - "когда буду в Пятёрочке" → Location  
-        3. Для относительного времени (e.g., "завтра", "через час") \
-        всегда указывай абсолютное время в формате "YYYY-MM-DD HH:MM".
-
-        ### Пример 1 (с текущим временем {current_time} = "2025-06-16 15:00"):
-        Ввод: 
-        {{
-            "text": "Выгулять собаку",
-            "categoryType": "Routine",
-            "triggers": [
-                {{
-                    "triggerType": "Time",
-                    "triggerValue": "2025-06-16 18:00"
-                }}
-            ]
-        }}
-        Вывод:
-        Напомнить выгулять собаку через 3 часа?
-
-        ### Пример 2 (с текущим временем {current_time} = "2025-06-16 09:00"):
-        Ввод:
-        {{
-            "text": "Позвонить врачу",
-            "categoryType": "Health",
-            "triggers": [
-                {{
-                    "triggerType": "Time",
-                    "triggerValue": "2025-06-17 10:00"
-                }}
-            ]
-        }}
-        Вывод:
-        Напомнить позвонить врачу завтра в 10:00
+        try:
+            # Разрешение семафора и соединение держим до конца генерации, а не только до заголовков
+            async with self._gpt_sem, self._client.stream("POST", self.ygpt_url, content=content) as response:
+                # Ошибку отдаем до первого чанка, пока еще можно вернуть статус ответа
+                if response.is_error:
+                    await response.aread()
+                    raise HTTPException(
+                        status_code=response.status_code,
+                        detail=f"YandexGPT API error: {response.text}"
+                    )
+
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    result = orjson.loads(line)
+                    yield result['result']['alternatives'][0]['message']['text']
+        except httpx.HTTPError as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Text processing failed: {str(e)}"
+            )
 
-        Теперь предложи пользователю подсказку для следующего напоминания в формате JSON \
-        (текущее время: {current_time}):
-        """
+    @staticmethod
+    @lru_cache(maxsize=1024)
+    def build_prompt(current_time: datetime) -> str:
+        # current_time с точностью до минуты, так что запросы одной минуты делят один промпт
+        return format_datetime(current_time).join(_PROMPT_PARTS)
 
 
 hints_generation_service = HintsGenerationService()